@@ -1,9 +1,20 @@
 import streamlit as st
-import requests
 import json
 import re
 import random
+import io
 from datetime import datetime
+from types import MappingProxyType
+
+try:
+    import orjson
+    _json_loads = orjson.loads
+    _json_dumps = orjson.dumps
+except ImportError:
+    _json_loads = json.loads
+
+    def _json_dumps(obj):
+        return json.dumps(obj).encode("utf-8")
 
 # -------------------------
 # CONFIGURATION - Secure API Key Handling
@@ -24,103 +35,328 @@ except Exception as e:
     st.stop()
     
 URL = "https://api.openai.com/v1/chat/completions"
+FILES_URL = "https://api.openai.com/v1/files"
+BATCHES_URL = "https://api.openai.com/v1/batches"
+
+_RE_JSON_PREFIX = re.compile(r'^```json\s*')
+_RE_JSON_SUFFIX = re.compile(r'\s*```$')
+_RE_JSON_BLOB = re.compile(r'\{.*\}', re.DOTALL)
+_RE_OPTION_LABEL = re.compile(r'^([a-z])[).:]\s*', re.IGNORECASE)
 
 # -------------------------
 # Backend: OpenAI Quiz Generator
 # -------------------------
-def generate_quiz(text, num_questions=5):
-    """Generate quiz questions from text using OpenAI API"""
-    if not text or not text.strip():
-        return None, "Please provide text to generate questions from."
-    
-    if not API_KEY:
-        return None, "API key is required."
-    
-    headers = {
-        "Authorization": f"Bearer {API_KEY}",
-        "Content-Type": "application/json"
+MAX_CONCURRENT_REQUESTS = 8
+HISTORY_PAGE_SIZE = 20
+QUIZ_CACHE_SIZE = 128
+
+# Fixed instructions sent as the system message. At roughly 200 tokens this is
+# well under the 1024-token minimum for OpenAI's automatic prompt caching, so
+# the split is structural only and does not get a cache discount.
+INSTRUCTIONS_BLOCK = """
+You generate multiple-choice quiz questions from study material provided by the user.
+Return ONLY valid JSON in this exact format (no markdown, no extra text):
+
+{
+  "quiz": [
+    {
+      "question": "Question text here",
+      "options": ["a) First option", "b) Second option", "c) Third option", "d) Fourth option"],
+      "answer": "b) Second option",
+      "explanation": "Brief explanation of why this is correct"
     }
+  ]
+}
 
-    prompt = f"""
-    Generate exactly {num_questions} multiple-choice questions from the text below.
-    Return ONLY valid JSON in this exact format (no markdown, no extra text):
-
-    {{
-      "quiz": [
-        {{
-          "question": "Question text here",
-          "options": ["a) First option", "b) Second option", "c) Third option", "d) Fourth option"],
-          "answer": "b) Second option",
-          "explanation": "Brief explanation of why this is correct"
-        }}
-      ]
-    }}
+Rules:
+- Create clear, unambiguous questions
+- Ensure only one correct answer per question
+- Include brief explanations for correct answers
+- Base all questions strictly on the provided text
+- Make distractors plausible but incorrect
+"""
 
-    Rules:
-    - Create clear, unambiguous questions
-    - Ensure only one correct answer per question
-    - Include brief explanations for correct answers
-    - Base all questions strictly on the provided text
-    - Make distractors plausible but incorrect
+_PROMPT_TMPL = """Generate exactly {num_questions} multiple-choice questions from the text below.
 
-    Text:
-    {text}
-    """
+Text:
+{text}
+"""
+
+@st.cache_resource
+def get_session():
+    """Shared HTTP session so connections to the API are pooled across reruns"""
+    import requests
+    from requests.adapters import HTTPAdapter
 
-    data = {
+    session = requests.Session()
+    session.headers.update({"Authorization": f"Bearer {API_KEY}"})
+    session.mount("https://", HTTPAdapter(pool_connections=10, pool_maxsize=10))
+    return session
+
+def _build_request(text, num_questions):
+    """Build the chat completion request body for a quiz"""
+    prompt = _PROMPT_TMPL.format(num_questions=num_questions, text=text)
+
+    return {
         "model": "gpt-4o-mini",
-        "messages": [{"role": "user", "content": prompt}],
+        "messages": [
+            {"role": "system", "content": INSTRUCTIONS_BLOCK},
+            {"role": "user", "content": prompt}
+        ],
         "temperature": 0.5,
-        "max_tokens": 2000
+        # Roughly 150 tokens per question plus the JSON wrapper
+        "max_tokens": min(2000, 150 * num_questions + 200)
     }
 
-    try:
-        response = requests.post(URL, headers=headers, json=data, timeout=30)
-        
-        if response.status_code != 200:
-            if response.status_code == 401:
-                return None, "Invalid API key. Please check your OpenAI API key."
-            elif response.status_code == 429:
-                return None, "Rate limit exceeded. Please try again in a moment."
-            else:
-                return None, f"API Error {response.status_code}"
+def _status_error(status_code):
+    """Map a non-200 API status code to a user-facing message"""
+    if status_code == 401:
+        return "Invalid API key. Please check your OpenAI API key."
+    elif status_code == 429:
+        return "Rate limit exceeded. Please try again in a moment."
+    else:
+        return f"API Error {status_code}"
 
-        result = response.json()["choices"][0]["message"]["content"]
-        
+def _split_option(option):
+    """Split an option like "b) Second option" into ("b", "second option")"""
+    option = str(option).strip()
+    if len(option) == 1:
+        return option.lower(), ""
+    label = _RE_OPTION_LABEL.match(option)
+    if label:
+        return label.group(1).lower(), option[label.end():].strip().lower()
+    return None, option.lower()
+
+def _find_answer(options, answer):
+    """Index of the option matching answer, tolerating label differences; None if no match"""
+    if answer in options:
+        return options.index(answer)
+    letter, text = _split_option(answer)
+    for i, option in enumerate(options):
+        option_letter, option_text = _split_option(option)
+        if text and text == option_text:
+            return i
+        if not text and letter and letter == option_letter:
+            return i
+    return None
+
+def _parse_quiz(result):
+    """Parse the model's message content into a list of quiz questions"""
+    try:
+        quiz_data = _json_loads(result)
+    except json.JSONDecodeError:
         # Clean markdown formatting if present
-        result = re.sub(r'^```json\s*', '', result)
-        result = re.sub(r'\s*```$', '', result)
+        result = _RE_JSON_PREFIX.sub('', result)
+        result = _RE_JSON_SUFFIX.sub('', result)
         result = result.strip()
 
         try:
-            quiz_data = json.loads(result)
+            quiz_data = _json_loads(result)
         except json.JSONDecodeError:
             # Try to extract JSON if wrapped in text
-            match = re.search(r'\{.*\}', result, re.DOTALL)
+            match = _RE_JSON_BLOB.search(result)
             if match:
                 try:
-                    quiz_data = json.loads(match.group())
+                    quiz_data = _json_loads(match.group())
                 except:
                     return None, "Failed to parse quiz response."
             else:
                 return None, "Failed to parse quiz response."
 
-        quiz_questions = quiz_data.get("quiz", [])
+    if not isinstance(quiz_data, dict):
+        return None, "Failed to parse quiz response."
+
+    quiz_questions = quiz_data.get("quiz", [])
+
+    if not isinstance(quiz_questions, list) or not quiz_questions:
+        return None, "No questions were generated. Try with more text."
+
+    # Shuffle options, seeded by the question text so the order is stable.
+    # Malformed questions are skipped rather than failing the whole quiz.
+    valid_questions = []
+    for q in quiz_questions:
+        if not (isinstance(q, dict) and "options" in q and "answer" in q and "question" in q):
+            continue
+        if not (isinstance(q["question"], str) and isinstance(q["options"], list) and len(q["options"]) >= 2
+                and all(isinstance(option, str) for option in q["options"])):
+            continue
+        answer_idx = _find_answer(q["options"], q["answer"])
+        if answer_idx is None:
+            continue
+        q["answer"] = q["options"][answer_idx]
+        random.Random(q["question"]).shuffle(q["options"])
+        q["correct_idx"] = q["options"].index(q["answer"])
+        valid_questions.append(q)
+
+    if not valid_questions:
+        return None, "Invalid question format received."
+
+    return valid_questions, None
+
+def _request_quiz(text, num_questions=5, placeholder=None):
+    """Generate quiz questions from text using OpenAI API, streaming progress into placeholder"""
+    import requests
+
+    if not text or not text.strip():
+        return None, "Please provide text to generate questions from."
+    
+    if not API_KEY:
+        return None, "API key is required."
+    
+    data = _build_request(text, num_questions)
+    data["stream"] = True
+
+    try:
+        with get_session().post(
+            URL,
+            data=_json_dumps(data),
+            headers={"Content-Type": "application/json"},
+            timeout=30,
+            stream=True
+        ) as response:
+            if response.status_code != 200:
+                return None, _status_error(response.status_code)
+
+            # Accumulate content deltas from the server-sent event stream
+            chunks = []
+            received = 0
+            for line in response.iter_lines():
+                if not line.startswith(b"data: "):
+                    continue
+                payload = line[len(b"data: "):]
+                if payload == b"[DONE]":
+                    # Keep draining so the connection can be reused from the pool
+                    continue
+                choices = _json_loads(payload).get("choices")
+                delta = choices[0]["delta"].get("content") if choices else None
+                if delta:
+                    chunks.append(delta)
+                    received += len(delta)
+                    if placeholder is not None:
+                        placeholder.markdown(f"Generating... {received} chars")
+
+        if placeholder is not None:
+            placeholder.empty()
+
+        return _parse_quiz("".join(chunks))
         
-        if not quiz_questions:
-            return None, "No questions were generated. Try with more text."
+    except requests.exceptions.Timeout:
+        return None, "Request timed out. Please try again."
+    except requests.exceptions.RequestException as e:
+        return None, f"Network error: {str(e)}"
+    except Exception as e:
+        return None, f"Unexpected error: {str(e)}"
+
+def generate_quiz(text, num_questions=5, placeholder=None):
+    """Generate quiz questions from text, reusing this session's results for repeat requests"""
+    cache = st.session_state.quiz_cache
+    key = (text, num_questions)
+    if key in cache:
+        return cache[key], None
+
+    quiz, error = _request_quiz(text, num_questions, placeholder)
+    if quiz:
+        cache[key] = quiz
+        # Evict the oldest entry once the cache is full
+        if len(cache) > QUIZ_CACHE_SIZE:
+            del cache[next(iter(cache))]
+    return quiz, error
+
+async def generate_quiz_async(client, text, num_questions=5):
+    """Generate quiz questions from text using a shared httpx.AsyncClient"""
+    import httpx
+
+    if not text or not text.strip():
+        return None, "Please provide text to generate questions from."
+    
+    if not API_KEY:
+        return None, "API key is required."
+    
+    headers = {
+        "Authorization": f"Bearer {API_KEY}",
+        "Content-Type": "application/json"
+    }
+
+    data = _build_request(text, num_questions)
+
+    try:
+        response = await client.post(URL, headers=headers, content=_json_dumps(data), timeout=30)
         
-        # Shuffle options while preserving correct answer
-        for q in quiz_questions:
-            if "options" in q and "answer" in q and "question" in q:
-                correct = q["answer"]
-                random.shuffle(q["options"])
-                q["answer"] = correct
-            else:
-                return None, "Invalid question format received."
+        if response.status_code != 200:
+            return None, _status_error(response.status_code)
 
-        return quiz_questions, None
+        result = _json_loads(response.content)["choices"][0]["message"]["content"]
+        return _parse_quiz(result)
         
+    except httpx.TimeoutException:
+        return None, "Request timed out. Please try again."
+    except httpx.HTTPError as e:
+        return None, f"Network error: {str(e)}"
+    except Exception as e:
+        return None, f"Unexpected error: {str(e)}"
+
+def generate_all_quizzes(paragraphs, num_questions=5):
+    """Generate quizzes for several paragraphs concurrently"""
+    import asyncio
+    import httpx
+
+    async def _gather():
+        sem = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+        async with httpx.AsyncClient() as client:
+            async def _generate(text):
+                async with sem:
+                    return await generate_quiz_async(client, text, num_questions)
+            return await asyncio.gather(*(_generate(p) for p in paragraphs))
+
+    return asyncio.run(_gather())
+
+def submit_batch(paragraphs, num_questions=5):
+    """Submit quiz generation for several paragraphs as an OpenAI batch job"""
+    import requests
+
+    if not paragraphs:
+        return None, "Please add at least one paragraph first."
+    
+    if not API_KEY:
+        return None, "API key is required."
+    
+    buffer = io.BytesIO()
+    for i, text in enumerate(paragraphs):
+        line = {
+            "custom_id": f"p{i}",
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": _build_request(text, num_questions)
+        }
+        buffer.write(_json_dumps(line) + b"\n")
+    buffer.seek(0)
+
+    session = get_session()
+
+    try:
+        response = session.post(
+            FILES_URL,
+            data={"purpose": "batch"},
+            files={"file": ("quiz_batch.jsonl", buffer, "application/jsonl")},
+            timeout=30
+        )
+        if response.status_code != 200:
+            return None, _status_error(response.status_code)
+
+        response = session.post(
+            BATCHES_URL,
+            json={
+                "input_file_id": response.json()["id"],
+                "endpoint": "/v1/chat/completions",
+                "completion_window": "24h"
+            },
+            timeout=30
+        )
+        if response.status_code != 200:
+            return None, _status_error(response.status_code)
+
+        return response.json()["id"], None
+
     except requests.exceptions.Timeout:
         return None, "Request timed out. Please try again."
     except requests.exceptions.RequestException as e:
@@ -128,6 +364,90 @@ def generate_quiz(text, num_questions=5):
     except Exception as e:
         return None, f"Unexpected error: {str(e)}"
 
+def collect_batch(batch_id):
+    """Collect quiz questions from a finished OpenAI batch job
+
+    Returns (quiz, error, finished, failures); finished is True once the
+    batch has reached a terminal state and should no longer be polled, and
+    failures lists the paragraphs that produced no questions.
+    """
+    import requests
+
+    if not API_KEY:
+        return None, "API key is required.", False, []
+    
+    session = get_session()
+
+    try:
+        response = session.get(f"{BATCHES_URL}/{batch_id}", timeout=30)
+        if response.status_code != 200:
+            return None, _status_error(response.status_code), False, []
+
+        batch = response.json()
+        status = batch["status"]
+        if status in ("failed", "cancelled"):
+            return None, f"Batch {status}. Please submit it again.", True, []
+        # Expired batches can still carry partial results
+        if status not in ("completed", "expired"):
+            return None, f"Batch is {status.replace('_', ' ')}. Please check back later.", False, []
+        if not batch.get("output_file_id"):
+            if status == "expired":
+                return None, "Batch expired before producing any results. Please submit it again.", True, []
+            return None, "Batch finished without any results.", True, []
+
+        with session.get(
+            f"{FILES_URL}/{batch['output_file_id']}/content",
+            stream=True,
+            timeout=30
+        ) as response:
+            if response.status_code != 200:
+                return None, _status_error(response.status_code), False, []
+
+            results = {}
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                try:
+                    record = _json_loads(line)
+                    index = int(record["custom_id"][1:])
+                except (ValueError, TypeError, KeyError):
+                    continue
+                results[index] = record
+
+        # Parse each record on its own so one bad completion cannot fail the batch
+        quiz = []
+        failures = []
+        total = (batch.get("request_counts") or {}).get("total") or 0
+        for index in sorted(set(results) | set(range(total))):
+            record = results.get(index)
+            if record is None:
+                failures.append(f"Paragraph {index+1}: No result was returned.")
+                continue
+            try:
+                if record.get("error") or record["response"]["status_code"] != 200:
+                    failures.append(f"Paragraph {index+1}: Request failed.")
+                    continue
+                result = record["response"]["body"]["choices"][0]["message"]["content"]
+                questions, error = _parse_quiz(result)
+            except Exception:
+                questions, error = None, "Failed to parse quiz response."
+            if questions:
+                quiz.extend(questions)
+            else:
+                failures.append(f"Paragraph {index+1}: {error}")
+
+        if not quiz:
+            return None, "No questions were generated. Try with more text.", True, failures
+
+        return quiz, None, True, failures
+
+    except requests.exceptions.Timeout:
+        return None, "Request timed out. Please try again.", False, []
+    except requests.exceptions.RequestException as e:
+        return None, f"Network error: {str(e)}", False, []
+    except Exception as e:
+        return None, f"Unexpected error: {str(e)}", False, []
+
 # -------------------------
 # Initialize Session State
 # -------------------------
@@ -137,18 +457,32 @@ def init_session_state():
         "page": "main",
         "paragraphs": [],
         "quiz": [],
-        "user_answers": {},
+        "answer_idx": [],
+        "answered_count": 0,
         "quiz_ready": False,
         "show_results": False,
         "quiz_history": [],
+        "history_dates": set(),
+        "score_total": 0.0,
+        "history_page": 1,
         "current_paragraph": "",
         "dark_mode": True,
-        "num_questions": 5
+        "num_questions": 5,
+        "batch_id": None,
+        "quiz_cache": {},
+        "generation_errors": []
     }
     for key, value in defaults.items():
         if key not in st.session_state:
             st.session_state[key] = value
 
+def reset_answers(num_questions):
+    """Clear recorded answers along with the radio widgets holding them"""
+    st.session_state.answer_idx = [None] * num_questions
+    st.session_state.answered_count = 0
+    for i in range(num_questions):
+        st.session_state.pop(f"radio_{i}", None)
+
 init_session_state()
 
 # -------------------------
@@ -164,59 +498,58 @@ st.set_page_config(
 # -------------------------
 # Dynamic Theme System
 # -------------------------
-def get_colors():
-    """Get color scheme based on dark/light mode"""
-    if st.session_state.dark_mode:
-        return {
-            'bg_primary': '#0f172a',
-            'bg_secondary': '#1e293b',
-            'bg_card': '#1e293b',
-            'bg_card_hover': '#334155',
-            'text_primary': '#f1f5f9',
-            'text_secondary': '#cbd5e1',
-            'text_tertiary': '#94a3b8',
-            'accent_primary': '#8b5cf6',
-            'accent_secondary': '#a78bfa',
-            'border_color': '#334155',
-            'shadow': 'rgba(0, 0, 0, 0.5)',
-            'success_bg': '#064e3b',
-            'success_text': '#6ee7b7',
-            'error_bg': '#7f1d1d',
-            'error_text': '#fca5a5',
-            'warning_bg': '#78350f',
-            'warning_text': '#fcd34d',
-            'info_bg': '#1e3a8a',
-            'info_text': '#93c5fd'
-        }
-    else:
-        return {
-            'bg_primary': '#f1f5f9',
-            'bg_secondary': '#ffffff',
-            'bg_card': '#ffffff',
-            'bg_card_hover': '#f8fafc',
-            'text_primary': '#0f172a',
-            'text_secondary': '#1e293b',
-            'text_tertiary': '#475569',
-            'accent_primary': '#7c3aed',
-            'accent_secondary': '#6d28d9',
-            'border_color': '#cbd5e1',
-            'shadow': 'rgba(0, 0, 0, 0.15)',
-            'success_bg': '#dcfce7',
-            'success_text': '#14532d',
-            'error_bg': '#fee2e2',
-            'error_text': '#7f1d1d',
-            'warning_bg': '#fef3c7',
-            'warning_text': '#78350f',
-            'info_bg': '#dbeafe',
-            'info_text': '#1e3a8a'
-        }
+DARK_COLORS = MappingProxyType({
+    'bg_primary': '#0f172a',
+    'bg_secondary': '#1e293b',
+    'bg_card': '#1e293b',
+    'bg_card_hover': '#334155',
+    'text_primary': '#f1f5f9',
+    'text_secondary': '#cbd5e1',
+    'text_tertiary': '#94a3b8',
+    'accent_primary': '#8b5cf6',
+    'accent_secondary': '#a78bfa',
+    'border_color': '#334155',
+    'shadow': 'rgba(0, 0, 0, 0.5)',
+    'success_bg': '#064e3b',
+    'success_text': '#6ee7b7',
+    'error_bg': '#7f1d1d',
+    'error_text': '#fca5a5',
+    'warning_bg': '#78350f',
+    'warning_text': '#fcd34d',
+    'info_bg': '#1e3a8a',
+    'info_text': '#93c5fd'
+})
 
-colors = get_colors()
+LIGHT_COLORS = MappingProxyType({
+    'bg_primary': '#f1f5f9',
+    'bg_secondary': '#ffffff',
+    'bg_card': '#ffffff',
+    'bg_card_hover': '#f8fafc',
+    'text_primary': '#0f172a',
+    'text_secondary': '#1e293b',
+    'text_tertiary': '#475569',
+    'accent_primary': '#7c3aed',
+    'accent_secondary': '#6d28d9',
+    'border_color': '#cbd5e1',
+    'shadow': 'rgba(0, 0, 0, 0.15)',
+    'success_bg': '#dcfce7',
+    'success_text': '#14532d',
+    'error_bg': '#fee2e2',
+    'error_text': '#7f1d1d',
+    'warning_bg': '#fef3c7',
+    'warning_text': '#78350f',
+    'info_bg': '#dbeafe',
+    'info_text': '#1e3a8a'
+})
 
 # -------------------------
 # CSS Styling
 # -------------------------
-st.markdown(f"""
+@st.cache_data(show_spinner=False)
+def _css_for(dark):
+    """Render the stylesheet for the dark or light color scheme"""
+    colors = DARK_COLORS if dark else LIGHT_COLORS
+    return f"""
 <style>
     /* Base styling */
     .stApp {{
@@ -373,7 +706,9 @@ st.markdown(f"""
         margin: 2rem 0;
     }}
 </style>
-""", unsafe_allow_html=True)
+"""
+
+st.markdown(_css_for(st.session_state.dark_mode), unsafe_allow_html=True)
 
 # -------------------------
 # Sidebar Navigation
@@ -397,9 +732,10 @@ with st.sidebar:
     
     # Navigation buttons
     if st.button("🏠 Home", key="nav_home", use_container_width=True):
-        st.session_state.page = "main"
-        st.session_state.show_results = False
-        st.rerun()
+        if st.session_state.page != "main" or st.session_state.show_results:
+            st.session_state.page = "main"
+            st.session_state.show_results = False
+            st.rerun()
     
     if st.session_state.quiz_ready:
         if st.button("🎮 Go to Quiz", key="nav_quiz", use_container_width=True):
@@ -409,13 +745,14 @@ with st.sidebar:
     if st.session_state.quiz_history:
         if st.button("📊 View History", key="nav_history", use_container_width=True):
             st.session_state.page = "history"
+            st.session_state.history_page = 1
             st.rerun()
     
     st.markdown("---")
     
     # Stats
     if st.session_state.quiz_history:
-        avg_score = sum(h["score"] for h in st.session_state.quiz_history) / len(st.session_state.quiz_history)
+        avg_score = st.session_state.score_total / len(st.session_state.quiz_history)
         st.markdown(f"""
         <div class='stats-box'>
             <div class='stats-number'>{len(st.session_state.quiz_history)}</div>
@@ -427,6 +764,82 @@ with st.sidebar:
         </div>
         """, unsafe_allow_html=True)
 
+# -------------------------
+# Quiz Fragments
+# -------------------------
+def _render_progress(quiz):
+    """Render quiz progress and controls"""
+    # Progress
+    answered = st.session_state.answered_count
+    st.markdown(f"""
+    <div class='stats-box'>
+        <div class='stats-number'>{answered}/{len(quiz)}</div>
+        <div class='stats-label'>Answered</div>
+    </div>
+    """, unsafe_allow_html=True)
+    st.progress(answered / len(quiz))
+    
+    # Submit button
+    if st.button("✅ Submit Quiz", key="submit_btn", use_container_width=True, disabled=(answered < len(quiz))):
+        if not st.session_state.show_results:
+            st.session_state.show_results = True
+            st.rerun()
+    
+    if st.button("🔄 Reset", key="reset_btn", use_container_width=True):
+        if st.session_state.answered_count or st.session_state.show_results:
+            reset_answers(len(quiz))
+            st.session_state.show_results = False
+            st.rerun()
+    
+    if st.button("🏠 Home", key="quiz_home_sidebar", use_container_width=True):
+        st.session_state.page = "main"
+        st.session_state.show_results = False
+        st.rerun()
+
+def _on_answer(i):
+    """Record a radio change and keep the answered counter in sync"""
+    previous = st.session_state.answer_idx[i]
+    answer = st.session_state[f"radio_{i}"]
+    if (previous is None) != (answer is None):
+        st.session_state.answered_count += 1 if previous is None else -1
+    st.session_state.answer_idx[i] = answer
+
+def _render_question(i, q):
+    """Render a single question with its answer options"""
+    st.markdown(f"<div class='question-box'>", unsafe_allow_html=True)
+    st.markdown(f"**Question {i+1}**")
+    st.markdown(f"### {q['question']}")
+    
+    st.radio(
+        "Select your answer:",
+        options=range(len(q["options"])),
+        format_func=lambda idx: q["options"][idx],
+        index=st.session_state.answer_idx[i],
+        key=f"radio_{i}",
+        label_visibility="collapsed",
+        on_change=_on_answer,
+        args=(i,)
+    )
+    
+    st.markdown("</div>", unsafe_allow_html=True)
+
+@st.fragment
+def _render_quiz(quiz):
+    """Render the questions and progress panel so answering only reruns this fragment"""
+    col_main, col_side = st.columns([3, 1])
+    
+    with col_side:
+        _render_progress(quiz)
+    
+    with col_main:
+        st.title("🎮 Quiz Time!")
+        
+        for error in st.session_state.generation_errors:
+            st.warning(f"⚠️ Skipped {error}")
+        
+        for i, q in enumerate(quiz):
+            _render_question(i, q)
+
 # -------------------------
 # MAIN PAGE
 # -------------------------
@@ -459,6 +872,7 @@ if st.session_state.page == "main":
                 st.session_state.paragraphs = []
                 st.session_state.quiz = []
                 st.session_state.quiz_ready = False
+                st.session_state.batch_id = None
                 st.success("🗑️ All cleared!")
                 st.rerun()
     
@@ -469,20 +883,84 @@ if st.session_state.page == "main":
         st.markdown("<div class='card'>", unsafe_allow_html=True)
         st.subheader(f"📚 Saved Paragraphs ({len(st.session_state.paragraphs)})")
         
+        if st.button("⚡ Generate All", key="gen_quiz_all", use_container_width=True):
+            with st.spinner(f"🧠 Generating quizzes for {len(st.session_state.paragraphs)} paragraphs..."):
+                results = generate_all_quizzes(st.session_state.paragraphs, st.session_state.num_questions)
+            
+            quiz = []
+            errors = []
+            for i, (para_quiz, error) in enumerate(results):
+                if error:
+                    errors.append(f"Paragraph {i+1}: {error}")
+                    st.error(f"❌ Paragraph {i+1}: {error}")
+                elif para_quiz:
+                    quiz.extend(para_quiz)
+            
+            if quiz:
+                # Keep partial failures so the quiz page can explain the missing questions
+                st.session_state.generation_errors = errors
+                st.session_state.quiz = quiz
+                st.session_state.quiz_ready = True
+                reset_answers(len(quiz))
+                st.session_state.show_results = False
+                st.session_state.page = "quiz"
+                st.success(f"✅ Generated {len(quiz)} questions!")
+                st.rerun()
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.button("📤 Submit as Batch", key="submit_batch", use_container_width=True):
+                with st.spinner("📤 Submitting batch job..."):
+                    batch_id, error = submit_batch(st.session_state.paragraphs, st.session_state.num_questions)
+                
+                if error:
+                    st.error(f"❌ {error}")
+                else:
+                    st.session_state.batch_id = batch_id
+                    st.success("✅ Batch submitted! Collect the results once it completes.")
+        
+        with col2:
+            if st.session_state.batch_id:
+                if st.button("📥 Collect Batch Results", key="collect_batch", use_container_width=True):
+                    with st.spinner("📥 Collecting batch results..."):
+                        quiz, error, finished, failures = collect_batch(st.session_state.batch_id)
+                    
+                    if finished:
+                        st.session_state.batch_id = None
+                    
+                    for failure in failures:
+                        st.error(f"❌ {failure}")
+                    
+                    if error:
+                        if finished:
+                            st.error(f"❌ {error}")
+                        else:
+                            st.warning(f"⚠️ {error}")
+                    elif quiz:
+                        st.session_state.generation_errors = failures
+                        st.session_state.quiz = quiz
+                        st.session_state.quiz_ready = True
+                        reset_answers(len(quiz))
+                        st.session_state.show_results = False
+                        st.session_state.page = "quiz"
+                        st.success(f"✅ Generated {len(quiz)} questions!")
+                        st.rerun()
+        
         for i, para in enumerate(st.session_state.paragraphs):
             with st.expander(f"Paragraph {i+1} ({len(para)} characters)", expanded=(i == len(st.session_state.paragraphs) - 1)):
                 st.markdown(f"{para[:300]}{'...' if len(para) > 300 else ''}")
                 
                 if st.button(f"⚡ Generate Quiz", key=f"gen_quiz_{i}", use_container_width=True):
                     with st.spinner("🧠 Generating quiz questions..."):
-                        quiz, error = generate_quiz(para, st.session_state.num_questions)
+                        quiz, error = generate_quiz(para, st.session_state.num_questions, st.empty())
                     
                     if error:
                         st.error(f"❌ {error}")
                     elif quiz:
+                        st.session_state.generation_errors = []
                         st.session_state.quiz = quiz
                         st.session_state.quiz_ready = True
-                        st.session_state.user_answers = {}
+                        reset_answers(len(quiz))
                         st.session_state.show_results = False
                         st.session_state.page = "quiz"
                         st.success(f"✅ Generated {len(quiz)} questions!")
@@ -504,83 +982,40 @@ elif st.session_state.page == "quiz":
     else:
         quiz = st.session_state.quiz
         
-        col_main, col_side = st.columns([3, 1])
+        if not st.session_state.show_results:
+            # Quiz questions
+            _render_quiz(quiz)
         
-        with col_side:
-            # Progress
-            answered = len([k for k in st.session_state.user_answers.keys() if st.session_state.user_answers[k] is not None])
-            st.markdown(f"""
-            <div class='stats-box'>
-                <div class='stats-number'>{answered}/{len(quiz)}</div>
-                <div class='stats-label'>Answered</div>
-            </div>
-            """, unsafe_allow_html=True)
-            st.progress(answered / len(quiz))
-            
-            # Submit button
-            if st.button("✅ Submit Quiz", key="submit_btn", use_container_width=True, disabled=(answered < len(quiz))):
-                st.session_state.show_results = True
-                st.rerun()
-            
-            if st.button("🔄 Reset", key="reset_btn", use_container_width=True):
-                st.session_state.user_answers = {}
-                st.session_state.show_results = False
-                st.rerun()
+        else:
+            col_main, col_side = st.columns([3, 1])
             
-            if st.button("🏠 Home", key="quiz_home_sidebar", use_container_width=True):
-                st.session_state.page = "main"
-                st.session_state.show_results = False
-                st.rerun()
-        
-        with col_main:
-            if not st.session_state.show_results:
-                # Quiz questions
-                st.title("🎮 Quiz Time!")
-                
-                for i, q in enumerate(quiz):
-                    st.markdown(f"<div class='question-box'>", unsafe_allow_html=True)
-                    st.markdown(f"**Question {i+1}**")
-                    st.markdown(f"### {q['question']}")
-                    
-                    current = st.session_state.user_answers.get(i)
-                    
-                    answer = st.radio(
-                        "Select your answer:",
-                        options=q["options"],
-                        index=None if current is None else (q["options"].index(current) if current in q["options"] else None),
-                        key=f"radio_{i}",
-                        label_visibility="collapsed"
-                    )
-                    
-                    st.session_state.user_answers[i] = answer
-                    st.markdown("</div>", unsafe_allow_html=True)
+            with col_side:
+                _render_progress(quiz)
             
-            else:
+            with col_main:
                 # Results
                 st.title("📊 Quiz Results")
                 
-                score = 0
+                answer_idx = st.session_state.answer_idx
+                score = sum(1 for i, q in enumerate(quiz) if answer_idx[i] == q["correct_idx"])
                 total = len(quiz)
                 
                 for i, q in enumerate(quiz):
-                    user_ans = st.session_state.user_answers.get(i)
-                    correct_ans = q["answer"]
-                    
-                    if user_ans == correct_ans:
-                        score += 1
+                    user_idx = answer_idx[i]
+                    is_correct = user_idx == q["correct_idx"]
                     
                     st.markdown(f"<div class='question-box'>", unsafe_allow_html=True)
                     
-                    if user_ans == correct_ans:
+                    if is_correct:
                         st.success(f"✅ Question {i+1}: Correct!")
                     else:
                         st.error(f"❌ Question {i+1}: Incorrect")
                     
                     st.markdown(f"**{q['question']}**")
-                    st.markdown(f"**Your answer:** {user_ans if user_ans else 'No answer'}")
+                    st.markdown(f"**Your answer:** {q['options'][user_idx] if user_idx is not None else 'No answer'}")
                     
-                    if user_ans != correct_ans:
-                        st.markdown(f"**Correct answer:** {correct_ans}")
+                    if not is_correct:
+                        st.markdown(f"**Correct answer:** {q['answer']}")
                     
                     if "explanation" in q and q["explanation"]:
                         with st.expander("💡 Explanation"):
@@ -611,19 +1046,22 @@ elif st.session_state.page == "quiz":
                 """, unsafe_allow_html=True)
                 
                 # Save to history
-                if not any(h.get("date") == datetime.now().strftime("%Y-%m-%d %H:%M") for h in st.session_state.quiz_history):
+                now_str = datetime.now().strftime("%Y-%m-%d %H:%M")
+                if now_str not in st.session_state.history_dates:
+                    st.session_state.history_dates.add(now_str)
                     st.session_state.quiz_history.append({
-                        "date": datetime.now().strftime("%Y-%m-%d %H:%M"),
+                        "date": now_str,
                         "score": percentage,
                         "correct": score,
                         "total": total
                     })
+                    st.session_state.score_total += percentage
                 
                 # Action buttons
                 col1, col2 = st.columns(2)
                 with col1:
                     if st.button("🔄 Try Again", key="try_again", use_container_width=True):
-                        st.session_state.user_answers = {}
+                        reset_answers(len(quiz))
                         st.session_state.show_results = False
                         st.rerun()
                 
@@ -662,7 +1100,7 @@ elif st.session_state.page == "history":
             """, unsafe_allow_html=True)
         
         with col2:
-            avg = sum(h["score"] for h in st.session_state.quiz_history) / len(st.session_state.quiz_history)
+            avg = st.session_state.score_total / len(st.session_state.quiz_history)
             st.markdown(f"""
             <div class='stats-box'>
                 <div class='stats-number'>{avg:.1f}%</div>
@@ -681,14 +1119,24 @@ elif st.session_state.page == "history":
         
         st.markdown("### Recent Quizzes")
         
-        for i, rec in enumerate(reversed(st.session_state.quiz_history)):
+        shown = HISTORY_PAGE_SIZE * st.session_state.history_page
+        recent = st.session_state.quiz_history[-shown:][::-1]
+        for i, rec in enumerate(recent):
             idx = len(st.session_state.quiz_history) - i
             with st.expander(f"Quiz {idx} - {rec['date']} - Score: {rec['score']:.1f}%"):
                 st.markdown(f"**Score:** {rec['correct']}/{rec['total']} ({rec['score']:.1f}%)")
                 st.progress(rec['score'] / 100)
         
+        if len(st.session_state.quiz_history) > shown:
+            if st.button("⬇️ Load More", key="history_more", use_container_width=True):
+                st.session_state.history_page += 1
+                st.rerun()
+        
         if st.button("🗑️ Clear History", key="clear_history", use_container_width=True):
             st.session_state.quiz_history = []
+            st.session_state.history_dates = set()
+            st.session_state.score_total = 0.0
+            st.session_state.history_page = 1
             st.success("History cleared!")
             st.rerun()
         